@@ -4,8 +4,8 @@ from apscheduler.schedulers.blocking import BlockingScheduler
 from datetime import datetime
 import colorama
 
-seed_output = settings.seed_closet['inputdir']
-outside_output = settings.outside['inputdir']
+seed_output = settings.seed_closet.inputdir
+outside_output = settings.outside.inputdir
 
 scheduler = BlockingScheduler()
 lastrun = ""
@@ -2,6 +2,8 @@ from pyLapse.ImgSeq.utils import is_image_url
 from pyLapse.ImgSeq.image import ImageIO, save_image
 from datetime import datetime
 
+fetch_image_from_url = ImageIO.fetch_image_from_url
+
 
 class Camera:
     def __init__(self, name, imageurl, location=None):
@@ -31,7 +33,7 @@ class Camera:
             raise ValueError(value + ' does not seem to be an image url')
 
     def fetch_image(self):
-        img = ImageIO().fetch_image_from_url(self.imageurl)
+        img = fetch_image_from_url(self.imageurl)
         return img
 
     def save_image(self, outputdir, **kwargs):
@@ -1,14 +1,14 @@
 import six
 from apscheduler.triggers.cron import CronTrigger
 from os.path import basename, join
-from image import imageset_load, prepare_output_dir, ImageIO
+from image import imageset_load, prepare_output_dir, get_default_io
 from lapsetime import cron_image_filter
 from settings import outside
 
 CRON_ARG_NAMES = ('year', 'month', 'day', 'week', 'day_of_week', 'hour', 'minute', 'second')
 WRITER_OPTIONS = (
     'resize', 'quality', 'optimize', 'resolution', 'drawtimestamp', 'timestampformat', 'timestampfont',
-    'timestampfontsize', 'timestampcolor', 'timestamppos', 'prefix', 'zeropadding'
+    'timestampfontsize', 'timestampcolor', 'timestamppos', 'prefix', 'zeropadding', 'subsampling'
 )
 
 
@@ -57,7 +57,8 @@ class Collection:
     def _exports_from_config(self, exports):
         if not exports:
             pass
-        for name, config in exports.iteritems():
+        for name, spec in exports.iteritems():
+            config = spec.to_dict()
             subdir = config.pop('subdir', name)
             desc = config.pop('span', '')
             prefix = config.pop('prefix', '')
@@ -68,7 +69,7 @@ class Export(CronTrigger):
     CRON_ARG_NAMES = ('year', 'month', 'day', 'week', 'day_of_week', 'hour', 'minute', 'second')
     WRITER_OPTIONS = (
         'resize', 'quality', 'optimize', 'resolution', 'drawtimestamp', 'timestampformat', 'timestampfont',
-        'timestampfontsize', 'timestampcolor', 'timestamppos', 'zeropadding'
+        'timestampfontsize', 'timestampcolor', 'timestamppos', 'zeropadding', 'subsampling'
     )
 
     def __init__(self, name, subdir, imageset, prefix=None, desc=None, year=None, month=None, day=None, week=None,
@@ -86,7 +87,6 @@ class Export(CronTrigger):
     def run(self, outputdir, **kwargs):
         writer_args = dict((key, value) for (key, value) in six.iteritems(kwargs)
                            if key in self.WRITER_OPTIONS and value is not None)
-        io = ImageIO()
         imageindex = self.imageset.imageindex
         imagelist = cron_image_filter(imageindex, self, fuzzy=5)
         ext = basename(imageindex.keys()[0]).split('.')[-1]
@@ -94,7 +94,7 @@ class Export(CronTrigger):
         prepare_output_dir(outputdir, ext='jpg')
         outindex = self.imageset.index_files(imagelist)
 
-        io.write_imageset(outindex, outputdir, prefix=self.prefix, **writer_args)
+        get_default_io().write_imageset(outindex, outputdir, prefix=self.prefix, **writer_args)
 
     def __str__(self):
         cron_str = super(Export, self).__str__()
@@ -1,11 +1,15 @@
-import glob
+import hashlib
+import json
 import os
 import re
-import urllib2
-from StringIO import StringIO
+import shutil
+import sys
+import threading
 from datetime import datetime
+from io import BytesIO
 
 import psutil
+import requests
 from PIL import Image, ImageDraw, ImageFont
 
 from lapsetime import cron_image_filter, dayslice
@@ -17,12 +21,83 @@ formats = {
     'png': 'PNG'
 }
 
+# shared session so repeated polls of the same camera reuse the keep-alive connection.
+http_session = requests.Session()
+
+MANIFEST_NAME = '.pylapse-manifest.json'
+# manifest keys are output paths as unicode, the way json.dump needs them and json.load hands them back.
+MANIFEST_ENCODING = sys.getfilesystemencoding() or 'utf-8'
+READ_BUFFER_SIZE = 1 << 20
+# seconds to wait on a camera to connect or send more data, so a stalled one can't hang a capture.
+FETCH_TIMEOUT = 30
+
+# jpeg encoder settings to pass along with the other writer options, e.g. collection.export('Day', **ENCODER_PRESETS['fast'])
+ENCODER_PRESETS = {
+    'fast': dict(quality=85, optimize=False, subsampling=2),
+    'quality': dict(quality=95, optimize=False, subsampling=0),
+}
+
+# default capture filename: '<prefix>2017-06-04-123015.jpg', seconds optional.
+# two fixed width patterns instead of one with an optional seconds group; most files have seconds so that one goes first.
+FILENAME_WITH_SECONDS = re.compile(
+    r'.*?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})-(?P<hour>\d{2})(?P<minute>\d{2})(?P<seconds>\d{2})'
+)
+FILENAME_NO_SECONDS = re.compile(
+    r'.*?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})-(?P<hour>\d{2})(?P<minute>\d{2})'
+)
+
+font_cache = {}
+font_lock = threading.Lock()
+SPRITE_CACHE_SIZE = 256
+sprite_cache = {}
+# strftime fields that change more than once a minute. Timestamps using them almost never repeat, so a cached
+# sprite would cost more than drawing the text straight onto the frame.
+SUBMINUTE_FIELDS = re.compile(r'%[-#]?[SfXTcrs]')
+
 WRITER_OPTIONS = ('resize'' quality'' optimize'' resolution'
                   'drawtimestamp'' timestampformat'' timestampfont'
                   'timestampfontsize'' timestampcolor'' timestamppos'
                   'prefix', 'zeropadding')
 
 
+def load_font(font, size):
+    """
+    ImageFont.truetype re-reads and parses the font file on every call, so keep one per (font, size).
+    """
+    key = (font, size)
+    if key not in font_cache:
+        font_cache[key] = ImageFont.truetype(font, size)
+    return font_cache[key]
+
+
+def text_sprite(text, font, size, color):
+    """
+    Render text onto a transparent image once so frames sharing a timestamp string only need a paste.
+    :param text: text to render
+    :param font: path to font
+    :param size: font size
+    :param color: (R,G,B) values for color
+    :return: PIL.Image in RGBA mode
+    """
+    key = (text, font, size, color)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        spritefont = load_font(font, size)
+        # freetype faces aren't safe to measure or render from several threads at once.
+        with font_lock:
+            # transparent pixels already carry the text color so antialiased edges don't blend towards black.
+            sprite = Image.new('RGBA', spritefont.getsize(text), tuple(color[:3]) + (0,))
+            ImageDraw.Draw(sprite).text((0, 0), text, color, font=spritefont)
+        if len(sprite_cache) >= SPRITE_CACHE_SIZE:
+            sprite_cache.clear()
+        sprite_cache[key] = sprite
+    return sprite
+
+
+def match_default_filename(name):
+    return FILENAME_WITH_SECONDS.match(name) or FILENAME_NO_SECONDS.match(name)
+
+
 def imageset_load(inputdir, ext='jpg', mask='*', filematch=None):
     ih = ImageSet()
     obj = ih.import_folder(inputdir, ext, mask, filematch)
@@ -39,58 +114,63 @@ def download_image(url, outputdir, ext='jpg', resize=False,
                    quality=50, optimize=False, resolution=(1920, 1080),
                    drawtimestamp=False, timestampformat=None, filenameformat=None,
                    timestampfontsize=36, timestampcolor=(255, 255, 255), timestamppos=(0, 0), timestampfont=None,
-                   prefix="", zeropadding=5):
+                   prefix="", zeropadding=5, subsampling=2):
     writer_args = dict(
         ext=ext, filenameformat=filenameformat,
         resize=resize, quality=quality, optimize=optimize, resolution=resolution,
         drawtimestamp=drawtimestamp, timestampformat=timestampformat, timestampfontsize=timestampfontsize,
         timestampcolor=timestampcolor, timestamppos=timestamppos, timestampfont=timestampfont,
-        prefix=prefix, zeropadding=zeropadding,
+        prefix=prefix, zeropadding=zeropadding, subsampling=subsampling,
     )
     timestamp = datetime.now()
-    image = ImageIO().fetch_image_from_url(url)
-    return save_image(image, outputdir, **writer_args)
+    image = ImageIO.fetch_image_from_url(url)
+    return save_image(image, outputdir, timestamp, **writer_args)
 
 
 def save_image(image, outputdir, timestamp, ext='jpg', resize=False,
                quality=50, optimize=False, resolution=(1920, 1080),
                drawtimestamp=False, timestampformat=None, filenameformat=None,
                timestampfontsize=36, timestampcolor=(255, 255, 255), timestamppos=(0, 0), timestampfont=None,
-               prefix="", zeropadding=5):
+               prefix="", zeropadding=5, subsampling=2):
     if not timestampformat:
         timestampformat = '%Y-%m-%d %I:%M:%S %p'
     if not filenameformat:
         filenameformat = "{prefix}{timestamp:%Y-%m-%d-%H%M%S}.{ext}"
     imgformat = formats.get(ext, 'JPEG')
     if resize:
+        # draft only helps before the first load. fetch_image_from_url returns images still undecoded,
+        # and on an image that's already loaded it does nothing.
+        if image.format == 'JPEG':
+            image.draft('RGB', resolution)
         image.thumbnail(resolution)
     if drawtimestamp:
-        image = ImageIO().timestamp_image(image, timestamp,
-                                          timestampformat=timestampformat,
-                                          color=timestampcolor, size=timestampfontsize, font=timestampfont
-                                          )
+        image = get_default_io().timestamp_image(image, timestamp,
+                                                 timestampformat=timestampformat,
+                                                 color=timestampcolor, size=timestampfontsize, font=timestampfont
+                                                 )
     outputfile = outputdir + r'\\' + filenameformat.format(prefix=prefix,
                                                            timestamp=timestamp,
                                                            ext=ext)
 
     if not os.path.isdir(outputdir):
-        os.makedirs(outputfile)
+        os.makedirs(outputdir)
 
-    image.save("{}".format(outputfile), imgformat, quality=quality, optimize=optimize)
+    image.save(outputfile, imgformat, quality=quality, optimize=optimize, subsampling=subsampling)
     return "Saved {outputfile}".format(outputfile=outputfile)
 
 
 class ImageIO:
-    def __init__(self, outputdir=None, cpu_count=psutil.cpu_count, debug=False):
+    def __init__(self, outputdir=None, cpu_count=psutil.cpu_count, debug=False, multiprocess=True):
         self.cpu_count = cpu_count
         self.debug = debug
+        self.multiprocess = multiprocess
 
     def write_imageset(
             self, imageset, outputdir, resize=True,
             quality=50, optimize=False, resolution=(1920, 1080),
             drawtimestamp=False, timestampformat=None,
             timestampfontsize=36, timestampcolor=(255, 255, 255), timestamppos=(0, 0), timestampfont=None,
-            prefix="", zeropadding=5
+            prefix="", zeropadding=5, subsampling=2
     ):
         """
         :param timestampfont: 
@@ -105,6 +185,8 @@ class ImageIO:
         :param resolution: 
         :param drawtimestamp: 
         :param quality:
+        :param optimize: extra huffman table pass. 3-5% smaller files for a noticeably slower encode.
+        :param subsampling: jpeg chroma subsampling. 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
         :param timestampformat: 
         :param zeropadding: 
         :return: 
@@ -113,7 +195,7 @@ class ImageIO:
             resize=resize, quality=quality, optimize=optimize, resolution=resolution,
             drawtimestamp=drawtimestamp, timestampformat=timestampformat, timestampfont=timestampfont,
             timestampfontsize=timestampfontsize, timestampcolor=timestampcolor, timestamppos=timestamppos,
-            prefix=prefix, zeropadding=zeropadding
+            prefix=prefix, zeropadding=zeropadding, subsampling=subsampling
         )
         if not os.path.isdir(outputdir):
             print 'Creating output directory: %s' % outputdir
@@ -122,51 +204,80 @@ class ImageIO:
             timestampformat = r'%Y-%m-%d %I:%M:%S %p'
         if not prefix:
             prefix = os.path.basename(outputdir)
-        files = []
-        # print imageset
-        for day, images in imageset.iteritems():
-            # print day
-            for image, timestamp in images.iteritems():
-                files.append((os.path.normpath(image), timestamp))
-                # print timestamp
+        # ImageSet normalizes paths when it indexes them, so they can be used as they are here.
+        files = [imageinput for images in imageset.itervalues() for imageinput in images.iteritems()]
 
         outputfiles = sorted(files, key=lambda x: x[1])
         io_threading = utils.Threading(debug=self.debug)
-        if drawtimestamp:
-            # threader = io_threading.multiprocess_with_progressbar
-            threader = io_threading.thread_with_progressbar
+        if self.multiprocess and (resize or drawtimestamp):
+            # decode/resize/encode is CPU bound and Pillow retakes the GIL between calls, so use every core.
+            threader = io_threading.multiprocess_with_progressbar
         else:
             threader = io_threading.thread_with_progressbar
 
-        do_threads = threader(self.image_writer, outputfiles, outputdir, sendarg_i_idx=True, **writerargs)
+        # only re-render frames whose source or writer options changed since the last run.
+        manifest = load_manifest(outputdir)
+        newmanifest = {}
+        pending = []
+        for idx, imageinput in enumerate(outputfiles):
+            outputfile = manifest_path(sequence_filename(outputdir, writerargs['prefix'], idx, zeropadding))
+            newmanifest[outputfile] = manifest_key(imageinput[0], writerargs)
+            if manifest.get(outputfile) == newmanifest[outputfile] and os.path.isfile(outputfile):
+                continue
+            pending.append((idx, imageinput))
+        for stalefile in set(manifest) - set(newmanifest):
+            if os.path.isfile(stalefile):
+                os.remove(stalefile)
+        if len(pending) < len(outputfiles):
+            print 'Skipping %s unchanged frames' % (len(outputfiles) - len(pending))
+
+        failures = threader(write_indexed_image, pending, outputdir, sendarg_i=True, **writerargs)
+        for (idx, imageinput), error in failures:
+            # whatever file has this name wasn't rendered from the current source, so let the next run retry it.
+            del newmanifest[manifest_path(sequence_filename(outputdir, writerargs['prefix'], idx, zeropadding))]
+        if failures:
+            print 'Failed to write %s frames' % len(failures)
+        save_manifest(outputdir, newmanifest)
 
     def image_writer(self, imageinput, idx, outputdir, resize=False, quality=50, optimize=False,
                      resolution=(1920, 1080),
                      drawtimestamp=False, timestampformat=None, timestampfontsize=36,
                      timestampcolor=(255, 255, 255), timestamppos=(0, 0), timestampfont=None,
                      prefix=None,
-                     zeropadding=5):
+                     zeropadding=5, subsampling=2):
 
         inputimage, timestamp = imageinput
-        im = Image.open(inputimage)
-        if resize:
-            im.thumbnail(resolution)
-        if drawtimestamp:
-            im = self.timestamp_image(im, timestamp,
-                                      timestampformat=timestampformat,
-                                      color=timestampcolor, size=timestampfontsize, font=timestampfont
-                                      )
-        outputfile = outputdir + r'\{prefix} {seqence_idx}'.format(prefix=prefix,
-                                                                   seqence_idx=str(idx + 1).zfill(zeropadding)
-                                                                   )
-        im.save(outputfile + ".jpg", 'JPEG', quality=quality, optimize=optimize)
-        return "saved {outputfile}.jpg".format(outputfile=outputfile)
-
-    def fetch_image_from_url(self, url):
-        request = urllib2.Request(url)
-        imgdata = urllib2.urlopen(request).read()
-        image = Image.open(StringIO(imgdata))
-        return image
+        outputfile = sequence_filename(outputdir, prefix, idx, zeropadding)
+        if not resize and not drawtimestamp and inputimage.lower().endswith(('.jpg', '.jpeg')):
+            # nothing to change in the pixels, so skip the decode/encode round trip.
+            link_or_copy(inputimage, outputfile)
+            return "linked {outputfile}".format(outputfile=outputfile)
+        with open_image_file(inputimage) as imagefile:
+            im = Image.open(imagefile)
+            if resize:
+                # let libjpeg do the bulk of the downscale while decoding. draft only works on a freshly opened
+                # file, so don't load or copy the image before this.
+                if im.format == 'JPEG':
+                    im.draft('RGB', resolution)
+                im.thumbnail(resolution)
+            if drawtimestamp:
+                im = self.timestamp_image(im, timestamp,
+                                          timestampformat=timestampformat,
+                                          color=timestampcolor, size=timestampfontsize, font=timestampfont
+                                          )
+            # an earlier unchanged-pixels run may have linked this name to a source capture.
+            remove_output(outputfile)
+            im.save(outputfile, 'JPEG', quality=quality, optimize=optimize, subsampling=subsampling)
+        return "saved {outputfile}".format(outputfile=outputfile)
+
+    @staticmethod
+    def fetch_image_from_url(url):
+        """
+        :return: PIL.Image, opened but not decoded yet, so save_image can still draft it.
+        """
+        response = http_session.get(url, timeout=FETCH_TIMEOUT)
+        response.raise_for_status()
+        return Image.open(BytesIO(response.content))
 
     def timestamp_image(self, imageobj, datetimestamp, font=None,
                         timestampformat=None, pos=(0, 0), color=(255, 255, 255), size=72):
@@ -189,12 +300,37 @@ class ImageIO:
         if timestampformat and not datetimestamp:
             raise AttributeError('You must supply a datetime object if you want a timestamp')
         overlaytext = datetimestamp.strftime(timestampformat)
-        draw = ImageDraw.Draw(imageobj)
-        timestampfont = ImageFont.truetype(font, size)
-        draw.text(pos, overlaytext, color, font=timestampfont)
+        if SUBMINUTE_FIELDS.search(timestampformat):
+            draw = ImageDraw.Draw(imageobj)
+            # freetype faces aren't safe to render from several threads at once.
+            with font_lock:
+                draw.text(pos, overlaytext, color, font=load_font(font, size))
+        else:
+            sprite = text_sprite(overlaytext, font, size, color)
+            imageobj.paste(sprite, pos, sprite)
         return imageobj
 
 
+# ImageIO carries no per-call state, so one shared instance serves every export and capture.
+_default_io = ImageIO()
+
+
+def get_default_io():
+    return _default_io
+
+
+def write_indexed_image(idx, imageinput, outputdir, **writerargs):
+    """
+    Module level entry point to ImageIO.image_writer so it can be handed to worker processes.
+    write_imageset sends (idx, imageinput) items with sendarg_i, and mkargs spreads a tuple item into
+    separate arguments, so they arrive here as idx and imageinput.
+    :param idx: sequence index
+    :param imageinput: (image path, timestamp)
+    :return: str
+    """
+    return get_default_io().image_writer(imageinput, idx, outputdir, **writerargs)
+
+
 class ImageSet:
     def __init__(self):
         self.imageindex = None
@@ -217,55 +353,46 @@ class ImageSet:
         self.inputmask = '\\'.join((inputdir, (mask or "") + "." + ext))
         self.inputdir = inputdir
         self.setslug = self.inputmask
-        self.images = glob.glob(self.inputmask)
-        self.images.sort()
+        self.images = normalized_paths(utils.find_images(self.inputmask))
         self.filematch = filematch
         self.imageindex = self.index_files(self.images, self.filematch)
         return self
 
     def refresh_folder(self):
-        self.images = glob.glob(self.inputmask)
-        self.images.sort()
+        self.images = normalized_paths(utils.find_images(self.inputmask))
         self.imageindex = self.index_files(self.images, self.filematch)
 
     def import_from_list(self, imagelist, ext, mask, filematch):
-        self.images = imagelist
-        self.images.sort()
+        self.images = normalized_paths(imagelist)
         self.setslug = "from list"
         self.filematch = filematch
         self.imageindex = self.index_files(self.images, filematch)
         return self
 
     def index_files(self, files, filematch=None):
-        lastday = None
         self.imagecount = 0
         self.filematch = filematch
 
-        if not self.filematch:
-            self.filematch = re.compile(
-                r'.*?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})-'
-                r'(?P<hour>\d{2})(?P<minute>\d{2})(?P<seconds>\d{0,2})'
-            )
-
         days = {}
+        imagecount = 0
+        # this runs once per image in the collection, so bind the lookups up front.
+        basename = os.path.basename
+        filematch = self.filematch.match if self.filematch else match_default_filename
+        # the default patterns capture zero padded year/month/day, so the day key can be built from them directly.
+        padded = not self.filematch
         for f in files:
-            image = os.path.basename(f)
-            match = self.filematch.match(image)
+            match = filematch(basename(f))
             if not match:
                 continue
-            dateargs = list(match.groups())
-            if not match.group('seconds'):
-                dateargs[5] = '00'
-
-            timestamp = datetime(*[int(arg) for arg in dateargs])
-            day = timestamp.strftime('%Y-%m-%d')
-            if day != lastday:
-                days[day] = {f: timestamp}
-            elif day == lastday:
-                days[day].update({f: timestamp})
-
-            lastday = day
-            self.imagecount += 1
+            dateargs = match.groups()
+            if len(dateargs) < 6 or not dateargs[5]:
+                dateargs = dateargs[:5] + ('00',)
+
+            timestamp = datetime(*map(int, dateargs))
+            day = '-'.join(dateargs[:3]) if padded else timestamp.date().isoformat()
+            days.setdefault(day, {})[f] = timestamp
+            imagecount += 1
+        self.imagecount = imagecount
         return days
 
     def filter_images(self, hourlist=[i for i in xrange(0, 24)],
@@ -297,12 +424,13 @@ class ImageSet:
 def run_all(collections):
     # collections = (seed_closet, outside)
     for collection in collections:
-        name = collection['name']
-        inputdir = collection['inputdir']
-        sequence_storage = collection['sequence_storage']
-        exports = collection['exports']
-        for export, config in exports.iteritems():
-            print 'Running Export: {} with parameters {}'.format(export, config)
+        name = collection.name
+        inputdir = collection.inputdir
+        sequence_storage = collection.sequence_storage
+        exports = collection.exports
+        for export, spec in exports.iteritems():
+            print 'Running Export: {} with parameters {}'.format(export, spec)
+            config = spec.to_dict()
             start = datetime.now()
             enabled = config.pop('enabled', False)
             if not enabled:
@@ -317,12 +445,11 @@ def run_all(collections):
 
 
 def run_one(collection, span):
-    name = collection['name']
-    inputdir = collection['inputdir']
-    sequence_storage = collection['sequence_storage']
-    exports = collection['exports']
-    config = exports.get(span, None)
-    tempconfig = config.copy()
+    name = collection.name
+    inputdir = collection.inputdir
+    sequence_storage = collection.sequence_storage
+    exports = collection.exports
+    tempconfig = exports[span].to_dict()
     tempconfig.pop('enabled', None)
     if tempconfig:
         start = datetime.now()
@@ -356,7 +483,7 @@ def make_image_sequence(inputdir, outputdir,
                         prefix="", zeropadding=5
                         ):
     imageset = imageset_load(inputdir, ext, mask, filematch)
-    io = ImageIO(outputdir)
+    io = get_default_io()
     prepare_output_dir(outputdir, ext)
     if allframes:
         fileindex = imageset.imageindex
@@ -371,11 +498,99 @@ def make_image_sequence(inputdir, outputdir,
                       prefix, zeropadding)
 
 
+def normalized_paths(paths):
+    """
+    Normalize once when building an image set so the index keys can be compared and used directly.
+    :param paths: iterable of image paths
+    :return: sorted list of normalized paths
+    """
+    return sorted(map(os.path.normpath, paths))
+
+
+def open_image_file(path):
+    """
+    Open a source image with a large read buffer. Collections often live on network shares where every
+    small read is a round trip; PIL reads through the file object, so it gets the bigger buffer too.
+    Keep the file open until the image has been saved; PIL decodes lazily.
+    :param path: image path
+    :return: file
+    """
+    f = open(path, 'rb', READ_BUFFER_SIZE)
+    fadvise = getattr(os, 'posix_fadvise', None)
+    if fadvise:
+        fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    return f
+
+
+def remove_output(path):
+    """
+    Remove a previously written frame. It may be a hardlink to a source capture, so it has to be replaced,
+    never opened for writing.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def link_or_copy(src, dst):
+    remove_output(dst)
+    try:
+        os.link(src, dst)
+    except (AttributeError, OSError):
+        shutil.copyfile(src, dst)
+
+
+def sequence_filename(outputdir, prefix, idx, zeropadding=5):
+    # called for every frame of every export, plain % formatting is cheaper than str.format here.
+    return '%s\\%s %s.jpg' % (outputdir, prefix, str(idx + 1).zfill(zeropadding))
+
+
+def manifest_key(inputimage, writerargs):
+    """
+    Fingerprint of a source frame and the writer options it was rendered with.
+    :param inputimage: path to the source image
+    :param writerargs: dict of image writer options
+    :return: str
+    """
+    keysource = repr((inputimage, os.path.getmtime(inputimage), sorted(writerargs.items())))
+    return hashlib.sha1(keysource).hexdigest()[:16]
+
+
+def manifest_path(path):
+    """
+    :param path: output file path
+    :return: path as a unicode manifest key
+    """
+    if isinstance(path, unicode):
+        return path
+    return path.decode(MANIFEST_ENCODING)
+
+
+def load_manifest(outputdir):
+    manifestfile = os.path.join(outputdir, MANIFEST_NAME)
+    if not os.path.isfile(manifestfile):
+        return {}
+    with open(manifestfile) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def save_manifest(outputdir, manifest):
+    with open(os.path.join(outputdir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+
 def prepare_output_dir(outputdir, ext, mask='*'):
+    if os.path.isfile(os.path.join(outputdir, MANIFEST_NAME)):
+        # write_imageset keeps frames that are still current and prunes stale ones itself.
+        return
     if os.path.isdir(outputdir):
         print "Clearing out files from %s" % outputdir
         pattern = "{mask}.{ext}".format(mask=mask, ext=ext)
-        utils.clear_target(outputdir, pattern)
+        leftover = utils.clear_target(outputdir, pattern)
+        if leftover:
+            print "Could not remove %s files from %s" % (len(leftover), outputdir)
     else:
         print "Creating %s" % outputdir
         os.makedirs(outputdir)
@@ -2,26 +2,30 @@
 lapsetime:
 library for handling time operations on image sets.
 """
+import bisect
 import datetime
 
 from tzlocal import get_localzone
 from dateutil import parser
 import os
 
+TIMESTAMP_CACHE_SIZE = 8192
+timestamp_cache = {}
+
 
 class TimeSpans:
     """
     constants for common timeframes
     """
-    night = [21, 22, 23, 0, 1, 2, 3, 4, 5]
-    everytenmins = [minute for minute in xrange(0, 51, 10)]
-    everytwohours = [hour for hour in xrange(0, 25, 2)]
-    everyfivemins = [minute for minute in xrange(0, 56, 5)]
-    everytwomins = [minute for minute in xrange(0, 59, 2)]
-    everydayhour = [hour for hour in xrange(6, 20, 1)]
-    everyday2hours = [8, 10, 12, 14, 16, 20]
-    fifteenminutes = [0, 15, 30, 45]
-    dawntodusk = [i for i in (xrange(6, 21))]
+    night = (21, 22, 23, 0, 1, 2, 3, 4, 5)
+    everytenmins = tuple(xrange(0, 51, 10))
+    everytwohours = tuple(xrange(0, 25, 2))
+    everyfivemins = tuple(xrange(0, 56, 5))
+    everytwomins = tuple(xrange(0, 59, 2))
+    everydayhour = tuple(xrange(6, 20, 1))
+    everyday2hours = (8, 10, 12, 14, 16, 20)
+    fifteenminutes = (0, 15, 30, 45)
+    dawntodusk = tuple(xrange(6, 21))
 
 
 def dayslice(fileindex,
@@ -34,60 +38,54 @@ def dayslice(fileindex,
     :type verbose: bool
     :param fileindex: Dict of {str: {str: datetime}
     :type  fileindex: dict
-    :param hourlist: list of hours to pull images from
-    :type hourlist: list of int
-    :param minutelist: sub list of minutes to pull from each hour
-    :type minutelist: list of int
+    :param hourlist: hours to pull images from
+    :type hourlist: iterable of int
+    :param minutelist: minutes to pull from each hour
+    :type minutelist: iterable of int
     :return:
     """
 
     imageset = []
-    hourlist.sort()
+    # any iterable of hours/minutes will do; repeats would only select the same frame twice.
+    hourlist = sorted(set(hourlist))
     if not minutelist:
         minutelist = [0]
-    minutelist.sort()
+    minutelist = sorted(set(minutelist))
     if verbose:
         print "hour list: %s" % hourlist
         print "minute list: %s" % minutelist
     for day, files in fileindex.iteritems():
-        files = {key: value for key, value in sorted(files.iteritems(), key=lambda (k, v): (v, k))}
+        # bucket the day by hour once instead of rescanning every file for every target hour.
+        byhour = {}
+        for filename, timestamp in sorted(files.iteritems(), key=lambda (k, v): (v, k)):
+            hourminutes, hourfilenames = byhour.setdefault(timestamp.hour, ([], []))
+            hourminutes.append(timestamp.minute)
+            hourfilenames.append(filename)
         for targethour in hourlist:
-            hourminutes = []
-            hourfilenames = []
-            hrdbg = "Looking for targethour:{targethour}".format(targethour=targethour)
             if verbose:
-                print hrdbg
-            for filename, timestamp in sorted(files.iteritems()):
-
-                if timestamp.hour == targethour:
-                    # print "Found hour #{targethour} in {filename}: {timestamp}".format(targethour=targethour,
-                    #                                                                 filename=filename,
-                    #                                                                 timestamp=timestamp)
-                    hourminutes.append(timestamp.minute)
-                    hourfilenames.append(filename)
+                print "Looking for targethour:{targethour}".format(targethour=targethour)
+            if targethour not in byhour:
+                # print "No hours matching {hour} for day: {day}".format(day=day, hour=targethour)
+                continue
+            hourminutes, hourfilenames = byhour[targethour]
             if verbose:
                 print "hourfilenames: %s" % hourfilenames
                 print "hourminutes: %s" % hourminutes
-            if len(hourminutes) < 1:
-                # print "No hours matching {hour} for day: {day}".format(day=day, hour=targethour)
-                continue
 
             for targetminute in minutelist:
-                mindbg = "Looking for targetminute:{targetminute} in hourminutes:{hourminutes}".format(
-                    targetminute=targetminute,
-                    hourminutes=hourminutes
-                )
                 if verbose:
-                    print mindbg
+                    print "Looking for targetminute:{targetminute} in hourminutes:{hourminutes}".format(
+                        targetminute=targetminute,
+                        hourminutes=hourminutes
+                    )
                 match = find_nearest(hourminutes, targetminute, fuzzyness=fuzzy)
                 if match:
                     minute, idx = match
                     filename = hourfilenames[idx]
-                    fuzzdbg = '{filename}: {minute} is close enough to {target}'.format(minute=minute,
-                                                                                        target=targetminute,
-                                                                                        filename=filename)
                     if verbose:
-                        print fuzzdbg
+                        print '{filename}: {minute} is close enough to {target}'.format(minute=minute,
+                                                                                       target=targetminute,
+                                                                                       filename=filename)
 
                     imageset.append(filename)
                     # print "Day:{day} Imageset:{imageset}".format(day=day, imageset=imageset)
@@ -97,7 +95,14 @@ def dayslice(fileindex,
 
 def get_timestamp_from_file(filepath, fuzzy=True):
     filename = os.path.basename(filepath)
-    timestamp = parser.parse(filename, fuzzy=fuzzy)
+    # dateutil's fuzzy parse is slow and the same names get parsed again on every refresh.
+    key = (filename, fuzzy)
+    timestamp = timestamp_cache.get(key)
+    if timestamp is None:
+        timestamp = parser.parse(filename, fuzzy=fuzzy)
+        if len(timestamp_cache) >= TIMESTAMP_CACHE_SIZE:
+            timestamp_cache.clear()
+        timestamp_cache[key] = timestamp
     return timestamp
 
 
@@ -105,47 +110,78 @@ def find_nearest(array, value, fuzzyness=5):
     """Find nearest number to value in array
     :param fuzzyness: range of variance from target number
     :param value: number to find
-    :param array: iterable to find number in
+    :param array: list to find number in, sorted ascending
     :type value: int
     :type array: list
-    :returns minute, minuteidx: Minute closest to value and its index.
+    :returns minute, minuteidx: Minute closest to value and its index. Ties go to the earliest entry.
     :rtype tuple: int,int
     """
-    itemidx, item = min(enumerate(array), key=lambda x: abs(x[1] - value))
-    if abs(value - item) <= fuzzyness:
-        return item, itemidx
+    idx = bisect.bisect_left(array, value)
+    candidates = []
+    if idx < len(array):
+        candidates.append((abs(array[idx] - value), idx))
+    if idx > 0:
+        # step back to the first of any repeated values so ties resolve like a linear scan would.
+        candidates.append((abs(array[idx - 1] - value), bisect.bisect_left(array, array[idx - 1])))
+    if not candidates:
+        return None
+    distance, itemidx = min(candidates)
+    if distance <= fuzzyness:
+        return array[itemidx], itemidx
 
 
 def get_fire_times(crontrigger, day):
     day = datetime.datetime(day.year, day.month, day.day).replace(tzinfo=get_localzone())
     # print "Day: %s" % day.date()
-    cur_day = day
     last_fire = day - datetime.timedelta(microseconds=1)
     times = []
-    seconds = [i for i in range(0, 86399)]
-    while cur_day.date() == day.date():
+    while True:
         # print "Last Fire: %s" % last_fire
         now = last_fire + datetime.timedelta(microseconds=1)
         next_fire = crontrigger.get_next_fire_time(last_fire, now)
         # print "Next Fire: %s" % next_fire
+        if next_fire is None or next_fire.date() != day.date():
+            break
         times.append(next_fire.replace(tzinfo=None))
-        cur_day = next_fire
         last_fire = next_fire
     return times
 
 
+def day_utc_offsets(day):
+    """
+    Local UTC offsets at the start and the end of a day. They differ on DST changeover days.
+    :param day: datetime.date
+    :return: (timedelta, timedelta)
+    """
+    tz = get_localzone()
+    start = datetime.datetime(day.year, day.month, day.day)
+    end = start + datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+    return tz.utcoffset(start), tz.utcoffset(end)
+
+
 def cron_image_filter(imageindex, cron_trigger, fuzzy=5):
     images = []
+    # hour/minute/second fields don't depend on the date, so days with the same UTC offset share their fire
+    # times of day. DST changeover days skip or repeat an hour, and a start/end date can cut a day short;
+    # those get their own fire list.
+    fire_clocks = {}
+    bounded = cron_trigger.start_date or cron_trigger.end_date
     for day, files in sorted(imageindex.iteritems()):
         dt_day = datetime.datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=get_localzone())
         next_day = cron_trigger.get_next_fire_time(dt_day, dt_day)
-        fire_times = get_fire_times(cron_trigger, dt_day)
-        if next_day.date() == dt_day.date():
+        if next_day and next_day.date() == dt_day.date():
+            offsets = day_utc_offsets(dt_day)
+            if bounded or offsets[0] != offsets[1]:
+                fire_times = get_fire_times(cron_trigger, dt_day)
+            else:
+                if offsets not in fire_clocks:
+                    fire_clocks[offsets] = [fire.time() for fire in get_fire_times(cron_trigger, dt_day)]
+                fire_times = [datetime.datetime.combine(dt_day.date(), clock) for clock in fire_clocks[offsets]]
             # print dt_day
             last_match = None
             day_set = {key: value for key, value in sorted(files.iteritems(), key=lambda (k, v): (v, k))}
             reverse_day_set = {v: k for k, v in day_set.iteritems()}
-            day_timestamps = day_set.values()
+            day_timestamps = sorted(day_set.values())
             time_keys = [find_nearest_dt(i, day_timestamps, fuzzy) for i in fire_times]
             time_keys = filter(lambda x: x != None, time_keys)
             for key in time_keys:
@@ -155,8 +191,16 @@ def cron_image_filter(imageindex, cron_trigger, fuzzy=5):
 
 
 def find_nearest_dt(target_dt, dtlist, fuzzy=5):
-    deltas = [x for x in dtlist if (x - target_dt).seconds <= fuzzy * 60]
-    if len(deltas) < 1:
+    """Find the datetime in dtlist closest to target_dt
+    :param target_dt: datetime to look for
+    :param dtlist: list of datetime, sorted ascending
+    :param fuzzy: minutes either side of target_dt that still count as a match
+    :returns: closest datetime or None. Ties go to the earlier datetime.
+    """
+    idx = bisect.bisect_left(dtlist, target_dt)
+    candidates = dtlist[max(idx - 1, 0):idx + 1]
+    if not candidates:
         return None
-    else:
-        return min(deltas, key=lambda x: x - target_dt)
+    nearest = min(candidates, key=lambda x: abs(x - target_dt))
+    if abs(nearest - target_dt) <= datetime.timedelta(minutes=fuzzy):
+        return nearest
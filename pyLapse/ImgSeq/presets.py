@@ -0,0 +1,66 @@
+"""
+Read only records for the camera presets in settings.py. Presets are module globals shared by everything
+that imports settings, so none of them can be changed in place; callers take a to_dict() copy instead.
+"""
+
+
+class ReadOnlyDict(dict):
+    """
+    dict that refuses changes after construction. Reads are plain dict reads.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("%s is read only" % type(self).__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class Record(object):
+    """
+    Fixed set of read only fields. to_dict() gives a copy to hand along as keyword arguments.
+    """
+    __slots__ = ()
+    defaults = {}
+
+    def __init__(self, **fields):
+        unknown = set(fields) - set(self.__slots__)
+        if unknown:
+            raise TypeError("%s got unexpected fields: %s" % (type(self).__name__, ', '.join(sorted(unknown))))
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name, self.defaults.get(name)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read only" % type(self).__name__)
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
+        return "<%s %s>" % (type(self).__name__, fields)
+
+    def to_dict(self):
+        """
+        :return: dict of the fields that are set
+        """
+        return dict((name, getattr(self, name)) for name in self.__slots__ if getattr(self, name) is not None)
+
+
+class ExportSpec(Record):
+    """
+    One image sequence export of a camera preset. Unset hourlist/minutelist fall back to the
+    make_image_sequence defaults.
+    """
+    __slots__ = ('subdir', 'span', 'hourlist', 'minutelist', 'allframes', 'drawtimestamp', 'optimize', 'prefix',
+                 'enabled')
+    defaults = dict(span='', allframes=False, drawtimestamp=False, optimize=False, prefix='', enabled=False)
+
+
+class CameraPreset(Record):
+    """
+    A camera's source folder, sequence storage and exports.
+    :param exports: dict of {export name: ExportSpec}
+    """
+    __slots__ = ('name', 'sequence_storage', 'inputdir', 'exports')
+
+    def __init__(self, **fields):
+        if fields.get('exports') is not None:
+            fields['exports'] = ReadOnlyDict(fields['exports'])
+        super(CameraPreset, self).__init__(**fields)
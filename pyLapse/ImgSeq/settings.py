@@ -1,100 +1,54 @@
 from lapsetime import TimeSpans
+from presets import CameraPreset, ExportSpec
 
 timespans = TimeSpans()
 
+# shared by every preset below. frozen so one preset can't change them for the others.
+DAY_HOURS = frozenset(xrange(5, 22))
+TOP_OF_HOUR = frozenset((0,))
+
 # uncomment and modify if you want to override default threading preferences.
 # cpu_count = 4
 
 
-outside = dict(
+def make_export(subdir, span, prefix, enabled=True, **fields):
+    """
+    ExportSpec with the options every preset here shares: timestamped and optimized frames.
+    """
+    fields.setdefault('drawtimestamp', True)
+    fields.setdefault('optimize', True)
+    return ExportSpec(subdir=subdir, span=span, prefix=prefix, enabled=enabled, **fields)
+
+
+outside = CameraPreset(
     name="Outside 1",
     sequence_storage=r'F:\Timelapse\Image Sequences\Outside 1',
     inputdir=r'F:\Timelapse\2016\Outside 1',
     exports=dict(
-        full=dict(
-            subdir=r'Full',
-            minutelist=[0],
-            span='Full Time Span 15 Minute Intervals - Outside',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Outside ",
-            enabled=True
-        ),
-        all=dict(
-            subdir=r'All Frames',
-            allframes=True,
-            span='Every Frame - Outside',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Outside ",
-            enabled=False
-        ),
-        day=dict(
-            subdir=r'Day',
-            hourlist=[i for i in xrange(5, 22)],
-            minutelist=timespans.fifteenminutes,
-            span='Day Time Only 5am to 9pm - 15 minute intervals - Outside',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Outside ",
-            enabled=True
-        ),
-        night=dict(
-            subdir=r'Night',
-            hourlist=timespans.night,
-            minutelist=timespans.fifteenminutes,
-            span='Night Time Only 9pm to 5 am - 15 minute intervals - Outside',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Outside ",
-            enabled=True
-        ),
+        full=make_export(r'Full', 'Full Time Span 15 Minute Intervals - Outside', "Outside ",
+                         minutelist=TOP_OF_HOUR),
+        all=make_export(r'All Frames', 'Every Frame - Outside', "Outside ", enabled=False,
+                        allframes=True),
+        day=make_export(r'Day', 'Day Time Only 5am to 9pm - 15 minute intervals - Outside', "Outside ",
+                        hourlist=DAY_HOURS, minutelist=timespans.fifteenminutes),
+        night=make_export(r'Night', 'Night Time Only 9pm to 5 am - 15 minute intervals - Outside', "Outside ",
+                          hourlist=timespans.night, minutelist=timespans.fifteenminutes),
     )
 )
 
 # Seed Closet
-seed_closet = dict(
+seed_closet = CameraPreset(
     name="Seed Closet",
     sequence_storage=r'F:\Timelapse\Image Sequences\Seed Closet',
     inputdir=r'F:\Timelapse\2016\Seedling Closet',
     exports=dict(
-        full=dict(
-            subdir=r'Full',
-            minutelist=[0],
-            span='Full Time Span 15 Minute Intervals - Seed Closet',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Seed Closet ",
-            enabled=True
-        ),
-        all=dict(
-            subdir=r'All Frames',
-            allframes=True,
-            span='Every Frame - Seed Closet',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Seed Closet ",
-            enabled=False
-        ),
-        day=dict(
-            subdir=r'Day',
-            hourlist=[i for i in xrange(5, 22)],
-            minutelist=timespans.fifteenminutes,
-            span='Day Time Only 5am to 9pm - Seed Closet',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Seed Closet ",
-            enabled=True
-        ),
-        night=dict(
-            subdir=r'Night',
-            hourlist=timespans.night,
-            minutelist=timespans.fifteenminutes,
-            span='Night Time Only 9pm to 5 am - Seed Closet',
-            drawtimestamp=True,
-            optimize=True,
-            prefix="Seed Closet ",
-            enabled=True
-        ),
+        full=make_export(r'Full', 'Full Time Span 15 Minute Intervals - Seed Closet', "Seed Closet ",
+                         minutelist=TOP_OF_HOUR),
+        all=make_export(r'All Frames', 'Every Frame - Seed Closet', "Seed Closet ", enabled=False,
+                        allframes=True),
+        day=make_export(r'Day', 'Day Time Only 5am to 9pm - Seed Closet', "Seed Closet ",
+                        hourlist=DAY_HOURS, minutelist=timespans.fifteenminutes),
+        night=make_export(r'Night', 'Night Time Only 9pm to 5 am - Seed Closet', "Seed Closet ",
+                          hourlist=timespans.night, minutelist=timespans.fifteenminutes),
     )
 )
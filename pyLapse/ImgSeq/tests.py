@@ -14,6 +14,10 @@ from pyLapse.ImgSeq.lapsetime import get_fire_times, find_nearest_dt
 testoutputdir = r'F:\test\\'
 testseqdir = r'F:\test\\'
 
+# parsing cron expressions isn't free, build the triggers the tests share once.
+every_fifteen_minutes = CronTrigger(minute='*/15')
+morning_half_hours = CronTrigger(minute='*/30', hour='6-12')
+
 """
 Time Span Tests
 """
@@ -22,15 +26,14 @@ Time Span Tests
 def test_cron():
     from lapsetime import cron_image_filter
     reload(lapsetime)
-    ct = CronTrigger(minute='*/15')
     imageset = load_test_image_set()
-    image_list = cron_image_filter(imageset.imageindex, ct)
+    image_list = cron_image_filter(imageset.imageindex, every_fifteen_minutes)
     return image_list
 
 
 def test_match_time_to_fire_list():
     imageset = load_test_image_set()
-    ct = CronTrigger(minute='*/30', hour='6-12')
+    ct = morning_half_hours
     print ct
     day = '2017-06-04'
     day_dt = datetime.datetime.strptime(day, '%Y-%m-%d')
@@ -40,7 +43,7 @@ def test_match_time_to_fire_list():
     print reverse_day_set
     fire_times = get_fire_times(ct, day_dt)
     day_files = day_set.keys()
-    day_timestamps = day_set.values()
+    day_timestamps = sorted(day_set.values())
 
     for fire in fire_times:
         print 'Fire Time: %s' % fire
@@ -53,6 +56,31 @@ def test_dayslice():
     print imageslice
 
 
+def find_nearest_test():
+    minutes = [0, 0, 14, 28, 42, 56]
+    cases = [
+        # (array, target, fuzzyness, expected)
+        (minutes, 1, 5, (0, 0)),  # first of the repeated minutes
+        (minutes, 21, 5, None),  # nothing within 5 minutes of 21
+        (minutes, 21, 7, (14, 2)),  # 14 and 28 tie, earlier wins
+        (minutes, 59, 5, (56, 5)),
+        ([], 0, 5, None),
+    ]
+    for array, target, fuzzyness, expected in cases:
+        result = lapsetime.find_nearest(array, target, fuzzyness=fuzzyness)
+        assert result == expected, "find_nearest(%r, %r): %r != %r" % (array, target, result, expected)
+    print "find_nearest: Passed."
+
+
+def find_nearest_dt_test():
+    day = datetime.datetime(2017, 6, 4)
+    stamps = [day + datetime.timedelta(minutes=m) for m in (2, 58, 62)]
+    assert find_nearest_dt(day + datetime.timedelta(minutes=60), stamps) == stamps[1], "Ties go to the earlier frame"
+    assert find_nearest_dt(day + datetime.timedelta(days=1), stamps) is None, "Must not wrap around midnight"
+    assert find_nearest_dt(day + datetime.timedelta(minutes=30), stamps) is None
+    print "find_nearest_dt: Passed."
+
+
 def get_timestamp_from_file_test():
     reload(lapsetime)
     imageset = load_test_image_set()
@@ -85,7 +113,7 @@ def collection_create():
     from settings import seed_closet
     inputdir = r'F:\Timelapse\2016\Outside 1'
     outputdir = r'F:\test'
-    test_collection = collections.Collection('Test Outside', outputdir, inputdir, export_configs=seed_closet['exports'])
+    test_collection = collections.Collection('Test Outside', outputdir, inputdir, export_configs=seed_closet.exports)
     return test_collection
 
 
@@ -109,6 +137,22 @@ def clear_target_test():
     utils.clear_target(targetdir)
 
 
+def is_image_url_test():
+    cases = [
+        ('http://192.168.1.106:8080/photoaf.jpg', True),
+        ('https://example.com/cam/shot.jpeg', True),
+        ('http://192.168.1.106:8080/shot.JPG?t=1496577600', True),
+        ('//example.com/still.png', False),
+        ('http://192.168.1.106:8080/video', False),
+        ('http://example.com/photo.jpg.html', False),
+        ('http://example.com/logo.svg', False),
+        ('photoaf.jpg', False),
+    ]
+    for url, expected in cases:
+        assert utils.is_image_url(url) == expected, url
+    print "is_image_url: Passed."
+
+
 def download_file():
     import pyLapse.misctests
     url = pyLapse.misctests.get_camera(1)
@@ -151,6 +195,26 @@ def threaded_progressbar_test():
     threading.thread_with_progressbar(thread_dummy_func, imageset.images[:50], sendarg_i=True)
 
 
+def indexed_dummy_func(idx, imageinput, outputdir, **writerargs):
+    # same signature as image.write_indexed_image.
+    path, timestamp = imageinput
+    return idx, path, outputdir
+
+
+def indexed_items_test():
+    reload(utils)
+    stamp = datetime.datetime(2017, 6, 4)
+    # write_imageset hands the pools (idx, (path, timestamp)) items with sendarg_i.
+    items = [(idx, ('frame %s.jpg' % idx, stamp)) for idx in xrange(10)]
+    threading = utils.Threading(cpu_count=2)
+    for run in (threading.thread_with_progressbar, threading.multiprocess_with_progressbar):
+        failures = run(indexed_dummy_func, items, testoutputdir, sendarg_i=True, quality=50)
+        assert failures == [], "%s: %r" % (run.__name__, failures)
+        failures = run(indexed_dummy_func, items[:1], testoutputdir, sendarg_i=True, quality=50)
+        assert failures == [], "%s single item: %r" % (run.__name__, failures)
+    print "indexed items: Passed."
+
+
 def mkkwargs_testing():
     testkwargs = dict(test='test', othertest=True)
     testvaluemap = {0: 'value0', 1: 'value1', 4: 'not used'}
@@ -1,12 +1,27 @@
+import atexit
+import glob
+import logging
 import os
 import re
-import sys
+import threading
 import traceback
 from operator import itemgetter
 
 import psutil
 import tqdm
-from concurrent.futures import as_completed, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, \
+    TimeoutError
+
+logger = logging.getLogger(__name__)
+
+KW_VALUEMAP = {0: 't_idx', 1: 't_i'}
+process_pools = {}
+process_pools_lock = threading.Lock()
+# debug runs log this many results, and give up when nothing finishes for DEBUG_TIMEOUT seconds.
+DEBUG_RESULT_LIMIT = 100
+DEBUG_TIMEOUT = 300
+# http(s) url whose path ends in an image extension PIL can decode, optionally followed by a query string.
+IMAGE_URL = re.compile(r'^https?://[^\s"\'?#]+\.(?:jpe?g|png|gif|bmp|tiff?|webp)(?:\?[^\s"\']*)?$', re.IGNORECASE)
 
 
 def setpriority():
@@ -15,9 +30,56 @@ def setpriority():
 
 
 def clear_target(directory, mask='*.jpg'):
-    import glob
-    taggedfordeath = glob.glob(directory + r'\{mask}'.format(mask=mask))
-    Threading().thread_with_progressbar(os.remove, taggedfordeath, sendarg_i=True)
+    """
+    Delete the files in directory matching mask.
+    :return: list of files that couldn't be removed, e.g. still open in a viewer.
+    """
+    taggedfordeath = find_images(directory + r'\{mask}'.format(mask=mask))
+    # unlink waits on the filesystem, not the cpu, so a few threads hide most of the per-file latency.
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return [path for path in executor.map(try_remove, taggedfordeath) if path]
+
+
+def find_images(inputmask):
+    """
+    glob.glob with a shortcut for the usual '*.jpg' style mask: a suffix test per directory entry
+    instead of a regex match.
+    :param inputmask: glob pattern, e.g. 'F:\\Timelapse\\Outside\\*.jpg'
+    :return: list of matching paths
+    """
+    dirname, pattern = os.path.split(inputmask)
+    suffix = pattern[1:]
+    if not pattern.startswith('*') or glob.has_magic(suffix) or glob.has_magic(dirname):
+        return glob.glob(inputmask)
+    try:
+        names = os.listdir(dirname or os.curdir)
+    except os.error:
+        return []
+    suffix = os.path.normcase(suffix)
+    # same rules as glob: hidden files are skipped and case follows the platform.
+    return [os.path.join(dirname, name) for name in names
+            if name[0] != '.' and os.path.normcase(name).endswith(suffix)]
+
+
+def try_remove(path):
+    """
+    :return: None once removed, path if it couldn't be.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        return path
+
+
+def stacktraced_call(fn, *args, **kwargs):
+    """Calls `fn` preserving the traceback of any kind of raised exception.
+    Lives at module level so worker processes can unpickle it, and so thread submits
+    don't build a bound method per call.
+    """
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        raise type(e)(traceback.format_exc())
 
 
 class ThreadPoolExecutorStackTraced(ThreadPoolExecutor):
@@ -25,16 +87,7 @@ class ThreadPoolExecutorStackTraced(ThreadPoolExecutor):
         """Submits the wrapped function instead of `fn`"""
 
         return super(ThreadPoolExecutorStackTraced, self).submit(
-            self._function_wrapper, fn, *args, **kwargs)
-
-    def _function_wrapper(self, fn, *args, **kwargs):
-        """Wraps `fn` in order to preserve the traceback of any kind of
-        raised exception
-        """
-        try:
-            return fn(*args, **kwargs)
-        except Exception:
-            raise sys.exc_info()[0](traceback.format_exc())
+            stacktraced_call, fn, *args, **kwargs)
 
 
 class ProcessPoolExecutorStackTraced(ProcessPoolExecutor):
@@ -42,17 +95,31 @@ class ProcessPoolExecutorStackTraced(ProcessPoolExecutor):
         """Submits the wrapped function instead of `fn`"""
 
         return super(ProcessPoolExecutorStackTraced, self).submit(
-            self._function_wrapper, fn, *args, **kwargs)
+            stacktraced_call, fn, *args, **kwargs)
 
-    def _function_wrapper(self, fn, *args, **kwargs):
-        """Wraps `fn` in order to preserve the traceback of any kind of
-        raised exception
 
-        """
-        try:
-            return fn(*args, **kwargs)
-        except Exception:
-            raise sys.exc_info()[0](traceback.format_exc())
+def get_process_pool(max_workers):
+    """
+    Process pool shared by every multiprocess run with the same worker count. Starting workers, and on Windows
+    re-importing PIL and pyLapse in each of them, costs more than a small export, so pools stay up until exit.
+    :param max_workers: number of worker processes
+    :return: ProcessPoolExecutorStackTraced
+    """
+    with process_pools_lock:
+        pool = process_pools.get(max_workers)
+        if pool is None or getattr(pool, '_broken', False):
+            pool = process_pools[max_workers] = ProcessPoolExecutorStackTraced(max_workers=max_workers)
+        return pool
+
+
+def shutdown_process_pools():
+    with process_pools_lock:
+        for pool in process_pools.values():
+            pool.shutdown(wait=False)
+        process_pools.clear()
+
+
+atexit.register(shutdown_process_pools)
 
 
 def mkkwargs(keywords, valuemap=None, valueindexes=None, values=None, **kwargs):
@@ -139,17 +206,112 @@ def kw_send_idx_i_or_both(kws):
     return outdict
 
 
+def call_arguments(idx, i, args, kwargs, idxi):
+    """
+    Build the args and kwargs for one call, adding idx and/or i as asked for by the sendarg_/sendkw_ options.
+    :param idxi: output of kw_send_idx_i_or_both
+    :return: (args, kwargs)
+    """
+    values = [idx, i]
+    kwarg_idx = idxi['kwarg_idx']
+    if len(kwarg_idx) < 1:
+        func_kwargs = kwargs
+    else:
+        func_kwargs = mkkwargs(kwargs, KW_VALUEMAP, kwarg_idx, values)
+
+    argidx = idxi['arg_idx']
+    if len(argidx) < 1:
+        func_args = args
+    else:
+        func_args = mkargs(args, itemgetter(*argidx)(values))
+    return func_args, func_kwargs
+
+
+def run_serial(func, iterable, args, kwargs, idxi):
+    """
+    Run the calls in this thread, with the same per item error handling as the pools.
+    :return: list of (i, traceback) for the items that raised
+    """
+    return run_batch(func, list(enumerate(iterable)), args, kwargs, idxi, collect=False)[1]
+
+
+def run_batch(func, items, args, kwargs, idxi, collect=True):
+    """
+    Run a chunk of calls inside one worker task. Module level so worker processes can unpickle it.
+    The call arguments are built here, so the shared args and kwargs are pickled once per chunk instead of per item.
+    :param items: list of (idx, i)
+    :param idxi: output of kw_send_idx_i_or_both
+    An item that raises is recorded and the rest of the chunk carries on, so one bad frame only loses itself.
+    :param collect: return the results. Off when only side effects (file writes) matter, so the
+        results aren't kept and pickled back to the parent.
+    :return: (list of results or None when not collecting, list of (i, traceback) for the items that raised)
+    """
+    results = [] if collect else None
+    failures = []
+    for idx, i in items:
+        func_args, func_kwargs = call_arguments(idx, i, args, kwargs, idxi)
+        try:
+            result = func(*func_args, **func_kwargs)
+        except Exception:
+            failures.append((i, traceback.format_exc()))
+            continue
+        if collect:
+            results.append(result)
+    return results, failures
+
+
 class Threading:
     """
     Collection of threading tools
     """
 
-    def __init__(self, cpu_count=None, debug=False, pbarunit='items'):
+    def __init__(self, cpu_count=None, debug=False, pbarunit='items', thread_multiplier=5):
+        """
+        :param cpu_count: worker processes, and the base for the thread count. Defaults to all cores.
+        :param thread_multiplier: threads per core for thread_with_progressbar. The default suits work that mostly
+        waits on disk or network; use 1 for cpu bound functions so they don't fight over the GIL.
+        """
         self.debug = debug
         if cpu_count:
             self.cpu_count = cpu_count
         else:
             self.cpu_count = psutil.cpu_count()
+        self.thread_multiplier = thread_multiplier
+
+    def progressbar(self, total):
+        """
+        Progress bar shared by the thread and process runs. None in debug mode, which logs results instead.
+        Redraws are coalesced so tiny tasks (os.remove etc.) aren't bottlenecked on tqdm's lock and stderr.
+        """
+        if self.debug:
+            return None
+        return tqdm.tqdm(total=total, unit=' images', leave=True, ascii=True, mininterval=0.25,
+                         miniters=max(1, total // 200), smoothing=0)
+
+    @staticmethod
+    def log_results(results, result_count):
+        """
+        Debug log results until DEBUG_RESULT_LIMIT of them have been logged.
+        :return: updated result_count
+        """
+        for result in results:
+            if result_count <= DEBUG_RESULT_LIMIT:
+                logger.debug("%r", result)
+            result_count += 1
+        return result_count
+
+    @staticmethod
+    def print_failures(failures):
+        """
+        Print the items that raised and their tracebacks. Printed rather than logged: nothing here sets up
+        logging, and an export's failures have to be readable without it.
+        :param failures: list of (i, error)
+        :return: failures
+        """
+        for i, error in failures:
+            print 'Failed: %r' % (i,)
+            print error
+        return failures
 
     def thread_with_progressbar(self, func, iterable, *args, **kwargs):
         """
@@ -165,49 +327,50 @@ class Threading:
         :param args: args to pass to function
         :param kwargs: kwargs to pass to function
         :param iterable: iterable of things to thread with the function. 
+        :return: list of (i, error) for the items that raised
         """
-        kw_valuemap = {0: 't_idx', 1: 't_i'}
         idxi = kw_send_idx_i_or_both(kwargs)
-        with ThreadPoolExecutorStackTraced(max_workers=self.cpu_count*5) as executor:
-            futures = []
-
-            for idx, i in enumerate(iterable):
-                values = [idx, i]
-                kwarg_idx = idxi['kwarg_idx']
-                if len(kwarg_idx) < 1:
-                    func_kwargs = kwargs
-                else:
-                    func_kwargs = mkkwargs(kwargs, kw_valuemap, kwarg_idx, values)
-
-                argidx = idxi['arg_idx']
-                if len(idxi['arg_idx']) < 1:
-                    func_args = args
-                else:
-                    values = [idx, i]
-                    func_args = mkargs(args, itemgetter(*argidx)(values))
-
-                futures.append(executor.submit(func, *func_args, **func_kwargs))
-
-            if not self.debug:
-                pbargs = {
-                    'total': len(futures),
-                    'unit': ' images',
-                    'unit_scale': True,
-                    'leave': True,
-                    'ascii': True
-                }
-                tbar = tqdm.tqdm(as_completed(futures), **pbargs)
-                for f in tbar:
-                    pass
-
-            elif self.debug:
-                result_limit = 100
-                result_count = 0
-                for future in as_completed(futures, timeout=300):
-                    if result_count <= result_limit:
-                        print future.result()
-                    result_count += 1
-            executor.shutdown(wait=True)
+        iterable = list(iterable)
+        if len(iterable) < 2:
+            # starting a pool costs more than the work itself here.
+            return self.print_failures(run_serial(func, iterable, args, kwargs, idxi))
+        max_workers = max(1, int(self.cpu_count * self.thread_multiplier))
+        # keep a couple of futures per worker queued instead of one per item, so long runs
+        # don't hold a future for every image before the first one finishes.
+        window = 2 * max_workers
+        result_count = 0
+        failures = []
+        tbar = self.progressbar(len(iterable))
+        with ThreadPoolExecutorStackTraced(max_workers=max_workers) as executor:
+            pending = set()
+            submitted = {}
+            items = enumerate(iterable)
+            while True:
+                for idx, i in items:
+                    func_args, func_kwargs = call_arguments(idx, i, args, kwargs, idxi)
+                    future = executor.submit(func, *func_args, **func_kwargs)
+                    submitted[future] = i
+                    pending.add(future)
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, timeout=None if tbar is not None else DEBUG_TIMEOUT,
+                                     return_when=FIRST_COMPLETED)
+                if tbar is None and not done:
+                    raise TimeoutError("%d pending futures unfinished" % len(pending))
+                for future in done:
+                    i = submitted.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        failures.append((i, str(error)))
+                    elif tbar is None:
+                        result_count = self.log_results((future.result(),), result_count)
+                if tbar is not None:
+                    tbar.update(len(done))
+        if tbar is not None:
+            tbar.close()
+        return self.print_failures(failures)
 
     def multiprocess_with_progressbar(self, func, iterable, *args, **kwargs):
         """
@@ -219,50 +382,45 @@ class Threading:
         :param args: args to pass to function
         :param kwargs: kwargs to pass to function
         :param iterable: iterable of things to thread with the function. 
+        :return: list of (i, error) for the items that raised
         """
-        kw_valuemap = {0: 't_idx', 1: 't_i'}
         idxi = kw_send_idx_i_or_both(kwargs)
-        with ProcessPoolExecutorStackTraced(max_workers=self.cpu_count) as executor:
-            futures = []
-
-            for idx, i in enumerate(iterable):
-                values = [idx, i]
-                kwarg_idx = idxi['kwarg_idx']
-                if len(kwarg_idx) < 1:
-                    func_kwargs = kwargs
-                else:
-                    func_kwargs = mkkwargs(kwargs, kw_valuemap, kwarg_idx, values)
-
-                argidx = idxi['arg_idx']
-                if len(idxi['arg_idx']) < 1:
-                    func_args = args
-                else:
-                    values = [idx, i]
-                    func_args = mkargs(args, itemgetter(*argidx)(values))
-
-                futures.append(executor.submit(func, *func_args, **func_kwargs))
-
-            if not self.debug:
-                pbargs = {
-                    'total': len(futures),
-                    'unit': ' images',
-                    'unit_scale': True,
-                    'leave': True,
-                    'ascii': True
-                }
-                tbar = tqdm.tqdm(as_completed(futures), **pbargs)
-                for f in tbar:
-                    pass
-
-            elif self.debug:
-                result_limit = 100
-                result_count = 0
-                for future in as_completed(futures, timeout=300):
-                    if result_count <= result_limit:
-                        print future.result()
-                    result_count += 1
-            executor.shutdown(wait=True)
+        iterable = list(iterable)
+        if len(iterable) < 2:
+            # starting a pool costs more than the work itself here.
+            return self.print_failures(run_serial(func, iterable, args, kwargs, idxi))
+        items = list(enumerate(iterable))
+        # hand each worker a chunk of items so pickling func and the shared args/kwargs happens per chunk, not per item.
+        # 4 chunks per worker keeps the tail short when some items take longer than others.
+        chunksize = max(1, -(-len(items) // (self.cpu_count * 4)))
+        executor = get_process_pool(self.cpu_count)
+        futures = {}
+
+        # only debug mode looks at results, everything else runs for the side effects.
+        for start in xrange(0, len(items), chunksize):
+            chunk = items[start:start + chunksize]
+            futures[executor.submit(run_batch, func, chunk, args, kwargs, idxi, self.debug)] = chunk
+
+        result_count = 0
+        failures = []
+        tbar = self.progressbar(len(items))
+        for future in as_completed(futures, timeout=None if tbar is not None else DEBUG_TIMEOUT):
+            chunk = futures[future]
+            error = future.exception()
+            if error is not None:
+                # the batch itself broke (e.g. its worker died), so none of its items made it.
+                failures.extend((i, str(error)) for idx, i in chunk)
+            else:
+                results, chunk_failures = future.result()
+                failures.extend(chunk_failures)
+                if tbar is None:
+                    result_count = self.log_results(results, result_count)
+            if tbar is not None:
+                tbar.update(len(chunk))
+        if tbar is not None:
+            tbar.close()
+        return self.print_failures(failures)
 
 
 def is_image_url(url):
-    return True if re.match(r'(http)?s?:?(//[^\"\']*\.(?:png|jpg|jpeg|gif|svg))', url) else False
+    return bool(IMAGE_URL.match(url))
@@ -3,7 +3,17 @@ import serializers
 from rest_framework import viewsets, permissions
 
 
-class CameraViewSet(viewsets.ModelViewSet):
+class ListOnlyMixin(object):
+    """List requests load only the columns the serializer renders"""
+
+    def get_queryset(self):
+        queryset = super(ListOnlyMixin, self).get_queryset()
+        if self.action == 'list':
+            queryset = queryset.only(*self.get_serializer_class().Meta.fields)
+        return queryset
+
+
+class CameraViewSet(ListOnlyMixin, viewsets.ModelViewSet):
     """ViewSet for the Camera class"""
 
     queryset = models.Camera.objects.all()
@@ -11,7 +21,7 @@ class CameraViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class CaptureViewSet(viewsets.ModelViewSet):
+class CaptureViewSet(ListOnlyMixin, viewsets.ModelViewSet):
     """ViewSet for the Capture class"""
 
     queryset = models.Capture.objects.all()
@@ -19,7 +29,7 @@ class CaptureViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class CaptureScheduleViewSet(viewsets.ModelViewSet):
+class CaptureScheduleViewSet(ListOnlyMixin, viewsets.ModelViewSet):
     """ViewSet for the CaptureSchedule class"""
 
     queryset = models.CaptureSchedule.objects.all()
@@ -27,7 +37,7 @@ class CaptureScheduleViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class CaptureCameraViewSet(viewsets.ModelViewSet):
+class CaptureCameraViewSet(ListOnlyMixin, viewsets.ModelViewSet):
     """ViewSet for the CaptureCamera class"""
 
     queryset = models.CaptureCamera.objects.all()
@@ -15,7 +15,7 @@ class Camera(models.Model):
     # Fields
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
-    created = models.DateTimeField(auto_now_add=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
     web_interface_url = models.CharField(max_length=500, blank=True)
     image_url = models.CharField(max_length=100, blank=True)
@@ -42,7 +42,7 @@ class Capture(models.Model):
     # Fields
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
-    created = models.DateTimeField(auto_now_add=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
     collection_id = models.IntegerField()
     capture_start = models.DateTimeField()
@@ -66,7 +66,7 @@ class CaptureSchedule(models.Model):
     # Fields
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
-    created = models.DateTimeField(auto_now_add=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
     start_time = models.IntegerField()
     end_time = models.IntegerField()
@@ -94,7 +94,7 @@ class CaptureCamera(models.Model):
     # Fields
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
-    created = models.DateTimeField(auto_now_add=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
     camera_id = models.IntegerField()
     camera_alias = models.CharField(blank=True, max_length=30)
@@ -125,7 +125,7 @@ class Collection(models.Model):
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
     created = models.DateTimeField(auto_now_add=True, editable=False)
-    last_updated = models.DateTimeField(auto_now=True, editable=False)
+    last_updated = models.DateTimeField(auto_now=True, editable=False, db_index=True)
     collection_dir = models.CharField(max_length=255)
 
     class Meta:
@@ -151,7 +151,7 @@ class CaptureImage(models.Model):
     # Fields
     name = models.CharField(max_length=255)
     slug = extension_fields.AutoSlugField(populate_from='name', blank=True)
-    created = models.DateTimeField(auto_now_add=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
     capture = models.ForeignKey('lapsecore.Capture', )
     collection = models.ForeignKey('lapsecore.Collection', )